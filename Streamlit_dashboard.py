@@ -1,9 +1,20 @@
 import streamlit as st
 import pandas as pd
-import boto3
-import time
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+import asyncio
+import hashlib
+import io
+import re
+import threading
 import os
+import uuid
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from queries import q_revenue_rollup, q_top_cust, q_city, q_features
 # Add this temporary debug code
 import os
 
@@ -20,53 +31,553 @@ load_dotenv()
 AWS_REGION = 'ap-south-1'           
 S3_OUTPUT = 's3://dku-project/Athena Output/'  # Must end with a slash /
 DATABASE = 'ccdataset'
+# Result reuse needs an Athena engine v3 workgroup
+WORKGROUP = os.environ.get('ATHENA_WORKGROUP', 'primary')
+CACHE_TTL_SECONDS = 600  # How long fetched results are kept before Athena is asked again
+INLINE_RESULT_ROWS = 1000  # Results with at most this many rows skip the S3 download
 
-# --- 3. ATHENA QUERY FUNCTION ---
-def run_athena_query(query, database, s3_output):
+# --- 3. AWS CLIENTS ---
+# Query batches are driven by aiobotocore on a single event loop instead of a thread per
+# query. Streamlit re-executes this script on every interaction, so the loop and the clients
+# are kept with st.cache_resource: the loop runs on a background thread for the life of the
+# server process, and every rerun, session and query re-uses the same HTTPS connections.
+# The pool is large enough for all dashboard queries to be submitted and polled at once.
+@st.cache_resource(show_spinner=False)
+def _get_event_loop():
     """
-    Submits a query to Athena and returns the result as a Pandas DataFrame.
+    Starts the event loop every query batch runs on.
     """
-    # Create the Boto3 client using credentials from the environment (.env)
-    client = boto3.client(
-        'athena', 
-        region_name=AWS_REGION
-        # Note: boto3 automatically picks up AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY from env
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='athena-event-loop', daemon=True).start()
+    return loop
+
+@st.cache_resource(show_spinner=False)
+def get_async_clients(region):
+    """
+    Returns the shared aiobotocore Athena and S3 clients, bound to the query event loop.
+    """
+    async def create():
+        # Note: aiobotocore picks up AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY from env, like boto3
+        session = get_session()
+        config = AioConfig(
+            max_pool_connections=32,
+            retries={'mode': 'adaptive', 'max_attempts': 5}
+        )
+        # The clients stay open for as long as the server runs
+        athena = await session.create_client('athena', region_name=region, config=config).__aenter__()
+        s3 = await session.create_client('s3', region_name=region, config=config).__aenter__()
+        return athena, s3
+    return asyncio.run_coroutine_threadsafe(create(), _get_event_loop()).result()
+
+# --- 4. ATHENA QUERY FUNCTIONS ---
+class QueryBatchError(Exception):
+    """
+    Raised when some queries of a batch fail.
+    `results` holds the DataFrames of the queries that succeeded, `errors` the
+    exception of each one that didn't.
+    """
+    def __init__(self, results, errors):
+        super().__init__(f"{len(errors)} of {len(results) + len(errors)} queries failed")
+        self.results = results
+        self.errors = errors
+
+async def _start_query(client, query, database, s3_output, max_age_minutes=60):
+    """
+    Submits a query to Athena and returns its QueryExecutionId.
+    If `max_age_minutes` is set, Athena may answer with the results of an identical
+    query run within that many minutes instead of scanning S3 again.
+    """
+    reuse = {'Enabled': False}
+    if max_age_minutes:
+        reuse = {'Enabled': True, 'MaxAgeInMinutes': max_age_minutes}
+
+    response = await client.start_query_execution(
+        QueryString=query,
+        QueryExecutionContext={'Database': database},
+        ResultConfiguration={'OutputLocation': s3_output},
+        WorkGroup=WORKGROUP,
+        ResultReuseConfiguration={'ResultReuseByAgeConfiguration': reuse}
     )
-    
-    # A. Submit the query
-    try:
-        response = client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': s3_output}
+    return response['QueryExecutionId']
+
+async def _finished_executions(client, query_execution_ids):
+    """
+    Checks on several running queries with BatchGetQueryExecution (up to 50 IDs per call)
+    and returns the QueryExecution details of the ones that have finished.
+    """
+    finished = []
+    for start in range(0, len(query_execution_ids), 50):
+        response = await client.batch_get_query_execution(
+            QueryExecutionIds=query_execution_ids[start:start + 50]
+        )
+        finished += [
+            execution for execution in response['QueryExecutions']
+            if execution['Status']['State'] in ['SUCCEEDED', 'FAILED', 'CANCELLED']
+        ]
+    return finished
+
+def _as_unload(query, s3_output):
+    """
+    Wraps a SELECT in an UNLOAD that writes its result as Snappy-compressed Parquet to
+    a fresh prefix under `s3_output` (UNLOAD needs an empty target location).
+    The files are left for other sessions to re-use; an S3 lifecycle rule on `unload/`
+    expires them (see README.md).
+    """
+    location = f"{s3_output}unload/{uuid.uuid4().hex}/"
+    return f"UNLOAD ({query.strip()}) TO '{location}' WITH (format = 'PARQUET', compression = 'SNAPPY')"
+
+# Matches the statements built by _as_unload
+_UNLOAD_PATTERN = re.compile(
+    r"^UNLOAD \((?P<query>.*)\) TO '(?P<location>[^']*)' "
+    r"WITH \(format = 'PARQUET', compression = 'SNAPPY'\)$",
+    re.DOTALL
+)
+
+def _split_s3_path(s3_path):
+    """
+    Splits an s3://bucket/key path into its bucket and key.
+    """
+    bucket, key = s3_path.removeprefix('s3://').split('/', 1)
+    return bucket, key
+
+# Arrow types for the Athena column types that shouldn't stay strings
+_ATHENA_TYPES = {
+    'boolean': pa.bool_(),
+    'tinyint': pa.int8(),
+    'smallint': pa.int16(),
+    'integer': pa.int32(),
+    'bigint': pa.int64(),
+    'float': pa.float32(),
+    'real': pa.float32(),
+    'double': pa.float64(),
+    'decimal': pa.float64(),
+    'date': pa.date32(),
+    'timestamp': pa.timestamp('ms'),
+}
+
+def _arrow_types(column_info):
+    """
+    Maps the ColumnInfo of an Athena result to a dict of column name -> Arrow type.
+    """
+    return {column['Name']: _ATHENA_TYPES.get(column['Type'], pa.string()) for column in column_info}
+
+# Strings stay in Arrow's contiguous buffers instead of becoming one Python object per value
+_PANDAS_TYPES = {
+    pa.string(): pd.ArrowDtype(pa.string()),
+    pa.large_string(): pd.ArrowDtype(pa.large_string()),
+}
+
+def _to_pandas(table, **kwargs):
+    """
+    Converts an Arrow table to a Pandas DataFrame with Arrow-backed string columns
+    and DATE columns as datetime64.
+    """
+    # UNLOAD writes DECIMAL columns as Parquet decimals, which Pandas would hold as Python
+    # Decimal objects; read them as float64 like the CSV and inline readers do
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    return table.to_pandas(date_as_object=False, types_mapper=_PANDAS_TYPES.get, **kwargs)
+
+async def _download(s3, bucket, key):
+    """
+    Downloads one object from S3.
+    """
+    response = await s3.get_object(Bucket=bucket, Key=key)
+    async with response['Body'] as body:
+        return await body.read()
+
+class _BlockingBody(io.RawIOBase):
+    """
+    Blocking, file-like view of an aiobotocore response body for a reader on a worker
+    thread. Each read waits for the next chunk to be downloaded on the event loop.
+    """
+    def __init__(self, body, loop):
+        self.body = body
+        self.loop = loop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = asyncio.run_coroutine_threadsafe(self.body.read(len(buffer)), self.loop).result()
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+def _parse_csv(body, column_types):
+    """
+    Parses a CSV result file, streaming it into PyArrow in 4 MiB blocks so the whole
+    file never has to sit in memory next to the parsed result.
+    """
+    reader = pv.open_csv(
+        pa.PythonFile(body, mode='r'),
+        read_options=pv.ReadOptions(block_size=4 << 20),
+        # Athena writes NULL as an empty unquoted field and '' as a quoted one
+        convert_options=pv.ConvertOptions(
+            column_types=column_types,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False
         )
-        query_execution_id = response['QueryExecutionId']
-    except Exception as e:
-        st.error(f"Failed to start query: {e}")
+    )
+    table = pa.Table.from_batches(list(reader), schema=reader.schema)
+    return _to_pandas(table, self_destruct=True)
+
+async def _read_csv_results(athena, s3, execution):
+    """
+    Reads a query's CSV result file, parsing it on a worker thread as it downloads.
+    """
+    # Streamed blocks can't infer types from the whole file, so take them from Athena
+    metadata = await athena.get_query_results(QueryExecutionId=execution['QueryExecutionId'], MaxResults=1)
+    column_types = _arrow_types(metadata['ResultSet']['ResultSetMetadata']['ColumnInfo'])
+
+    bucket, key = _split_s3_path(execution['ResultConfiguration']['OutputLocation'])
+    response = await s3.get_object(Bucket=bucket, Key=key)
+    async with response['Body'] as body:
+        blocking_body = _BlockingBody(body, asyncio.get_running_loop())
+        return await asyncio.to_thread(_parse_csv, blocking_body, column_types)
+
+def _parse_parquet(bodies):
+    """
+    Parses downloaded Parquet files into one Pandas DataFrame.
+    """
+    # An UNLOAD of zero rows writes no files
+    if not bodies:
         return pd.DataFrame()
-    
-    # B. Wait for the query to complete
-    while True:
-        stats = client.get_query_execution(QueryExecutionId=query_execution_id)
-        status = stats['QueryExecution']['Status']['State']
-        if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+    return _to_pandas(pa.concat_tables([pq.read_table(pa.BufferReader(body)) for body in bodies]))
+
+async def _read_parquet_results(s3, location):
+    """
+    Reads every Parquet file an UNLOAD wrote under `location`, downloading them all at once.
+    """
+    bucket, prefix = _split_s3_path(location)
+    keys = []
+    async for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        keys += [item['Key'] for item in page.get('Contents', [])]
+    bodies = await asyncio.gather(*[_download(s3, bucket, key) for key in keys])
+    # Parsing is CPU work, so it runs off the event loop
+    return await asyncio.to_thread(_parse_parquet, bodies)
+
+# Matches a LIMIT at the very end of a query
+_LIMIT_PATTERN = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+
+def _is_small_result(query):
+    """
+    Whether `query` is limited to few enough rows to be read inline with
+    GetQueryResults rather than from a file on S3.
+    """
+    limit = _LIMIT_PATTERN.search(query)
+    return limit is not None and int(limit.group(1)) <= INLINE_RESULT_ROWS
+
+async def _read_inline_results(client, query_execution_id):
+    """
+    Reads a small result straight from the Athena API, skipping the S3 download.
+    """
+    columns, rows = None, []
+    pages = client.get_paginator('get_query_results').paginate(QueryExecutionId=query_execution_id)
+    async for page in pages:
+        page_rows = page['ResultSet']['Rows']
+        if columns is None:
+            columns = page['ResultSet']['ResultSetMetadata']['ColumnInfo']
+            # The first row of a SELECT's results holds the column names
+            page_rows = page_rows[1:]
+        rows += [[value.get('VarCharValue') for value in row['Data']] for row in page_rows]
+
+    table = pa.table({
+        name: pa.array([row[i] for row in rows], pa.string()).cast(arrow_type)
+        for i, (name, arrow_type) in enumerate(_arrow_types(columns).items())
+    })
+    return _to_pandas(table)
+
+async def _read_results(athena, s3, execution):
+    """
+    Reads the results of a finished query into a Pandas DataFrame, from the
+    Parquet files of an UNLOAD, inline for small results or from Athena's CSV result file.
+    """
+    unload = _UNLOAD_PATTERN.match(execution['Query'])
+    if unload:
+        return await _read_parquet_results(s3, unload['location'])
+    if _is_small_result(execution['Query']):
+        return await _read_inline_results(athena, execution['QueryExecutionId'])
+    return await _read_csv_results(athena, s3, execution)
+
+def _query_hash(query, database):
+    """
+    Identifies a query by its text and database, ignoring surrounding whitespace.
+    """
+    return hashlib.sha256(f"{database}\0{query.strip()}".encode()).hexdigest()
+
+async def _find_recent_executions(client, queries, database, max_age_minutes):
+    """
+    Looks through the workgroup's latest executions for successful runs of `queries`
+    that finished within `max_age_minutes` and scanned the data themselves, so their results
+    can be read from S3 instead of submitting the query again.
+    Returns a dict of query -> QueryExecution details.
+    """
+    if not max_age_minutes:
+        return {}
+    wanted = {_query_hash(query, database): query for query in queries}
+    response = await client.list_query_executions(WorkGroup=WORKGROUP, MaxResults=50)
+    ids = response['QueryExecutionIds']
+    if not ids:
+        return {}
+
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=max_age_minutes)
+    found = {}
+    response = await client.batch_get_query_execution(QueryExecutionIds=ids)
+    for execution in response['QueryExecutions']:
+        status = execution['Status']
+        if status['State'] != 'SUCCEEDED' or status['CompletionDateTime'] < cutoff:
+            continue
+        # A run answered by Athena's result reuse finished just now, but its data can be
+        # up to MaxAgeInMinutes older than that
+        reuse = execution.get('Statistics', {}).get('ResultReuseInformation', {})
+        if reuse.get('ReusedPreviousResult'):
+            continue
+        # An UNLOAD run counts as a run of the SELECT it wraps
+        unload = _UNLOAD_PATTERN.match(execution['Query'])
+        run_query = unload['query'] if unload else execution['Query']
+        run_database = execution.get('QueryExecutionContext', {}).get('Database', '')
+        query = wanted.get(_query_hash(run_query, run_database))
+        # Keep the freshest run of each query
+        if query is not None and (
+            query not in found
+            or status['CompletionDateTime'] > found[query]['Status']['CompletionDateTime']
+        ):
+            found[query] = execution
+    return found
+
+async def _read_and_postprocess(athena, s3, execution, postprocess):
+    """
+    Reads a finished query's results and runs its post-processing step, if it has one,
+    on a worker thread.
+    """
+    df = await _read_results(athena, s3, execution)
+    return await asyncio.to_thread(postprocess, df) if postprocess else df
+
+async def _run_queries_async(athena, s3, queries, database, s3_output, max_age_minutes, unload, postprocess):
+    """
+    Coroutine behind `_run_queries`: submits, polls and reads every query from one event loop.
+    """
+    results = {}
+
+    # Results of identical queries run recently (e.g. by another session) are read as-is
+    try:
+        recent = await _find_recent_executions(athena, queries.values(), database, max_age_minutes)
+    except Exception:
+        recent = {}
+
+    # A. Submit every query that has no recent result, all at once
+    to_start = {name: query for name, query in queries.items() if query not in recent}
+    starts = []
+    for query in to_start.values():
+        if unload and not _is_small_result(query):
+            starts.append(_start_query(athena, _as_unload(query, s3_output), database, s3_output, None))
+        else:
+            starts.append(_start_query(athena, query, database, s3_output, max_age_minutes))
+    started = await asyncio.gather(*starts, return_exceptions=True)
+
+    fetches = {
+        name: asyncio.create_task(_read_and_postprocess(athena, s3, recent[query], postprocess.get(name)))
+        for name, query in queries.items()
+        if query in recent
+    }
+    pending = {}
+    for name, outcome in zip(to_start, started):
+        if isinstance(outcome, Exception):
+            results[name] = RuntimeError(f"Failed to start query: {outcome}")
+        else:
+            pending[outcome] = name
+
+    # B. Poll all running queries with one call, backing off from 0.15s up to 2s,
+    #    and start reading each one's results as soon as it finishes
+    attempt = 0
+    while pending:
+        await asyncio.sleep(min(2.0, 0.15 * 2 ** attempt))
+        attempt += 1
+        try:
+            finished = await _finished_executions(athena, list(pending))
+        except Exception as e:
+            for name in pending.values():
+                results[name] = e
             break
-        time.sleep(1) # Wait 1 second before checking again
-    
-    # C. Fetch results if successful
-    if status == 'SUCCEEDED':
-        result_s3_path = stats['QueryExecution']['ResultConfiguration']['OutputLocation']
-        # Read directly into Pandas
-        return pd.read_csv(result_s3_path)
-    else:
-        st.error(f"Query Failed: {stats['QueryExecution']['Status']['StateChangeReason']}")
+        for execution in finished:
+            name = pending.pop(execution['QueryExecutionId'])
+            status = execution['Status']
+            if status['State'] == 'SUCCEEDED':
+                fetches[name] = asyncio.create_task(
+                    _read_and_postprocess(athena, s3, execution, postprocess.get(name))
+                )
+            else:
+                results[name] = RuntimeError(status.get('StateChangeReason', status['State']))
+
+    # C. Collect the results
+    for name, task in fetches.items():
+        try:
+            results[name] = await task
+        except Exception as e:
+            results[name] = e
+
+    return {name: results[name] for name in queries}
+
+def _run_queries(queries, database, s3_output, max_age_minutes=60, unload=False, postprocess=None):
+    """
+    Runs several independent queries at once and returns a dict with the same keys
+    as `queries`, holding either the result DataFrame or the exception the query failed with.
+
+    Every query is submitted up front and all of them are polled together, so the dashboard
+    waits for the slowest query instead of the sum of all of them. Submitting, polling and
+    downloading are driven for every query by the one shared event loop.
+    With `unload=True` the queries are run as UNLOADs to Parquet, which is smaller to
+    download and faster to read than CSV. Every UNLOAD writes to a new location, so
+    Athena's own result reuse can't apply to them; recent runs are still found and re-used.
+    Queries ending in a LIMIT of at most INLINE_RESULT_ROWS are never unloaded, their
+    results are read straight from the Athena API instead.
+
+    `postprocess` maps query names to a function applied to that query's DataFrame. It runs
+    on a worker thread right after the results are read, overlapping with the other
+    queries still running or downloading.
+    """
+    athena, s3 = get_async_clients(AWS_REGION)
+    batch = _run_queries_async(
+        athena, s3, queries, database, s3_output, max_age_minutes, unload, postprocess or {}
+    )
+    return asyncio.run_coroutine_threadsafe(batch, _get_event_loop()).result()
+
+def _empty_result(name, postprocess):
+    """
+    What a failed query stands in with: an empty DataFrame, post-processed like a real one.
+    """
+    process = (postprocess or {}).get(name)
+    return process(pd.DataFrame()) if process else pd.DataFrame()
+
+def run_athena_query(query, database, s3_output, max_age_minutes=60):
+    """
+    Submits a single query to Athena and returns the result as a Pandas DataFrame.
+    Pass max_age_minutes=None to force a fresh run instead of re-using recent results.
+    """
+    result = _run_queries({'query': query}, database, s3_output, max_age_minutes)['query']
+    if isinstance(result, Exception):
+        st.error(f"Query Failed: {result}")
         return pd.DataFrame()
+    return result
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def run_queries_cached(queries, database, max_age_minutes=60, _postprocess=None):
+    """
+    Runs several independent queries at once, fetching the results as Parquet through UNLOAD,
+    and returns a dict of DataFrames with the same keys as `queries`. The DataFrames are kept
+    for CACHE_TTL_SECONDS across reruns and sessions.
+    Raises QueryBatchError if any query fails, so failures are never cached.
+    Functions can't be hashed, so `_postprocess` is left out of the cache key: always pass
+    the same one for the same queries.
+    """
+    results = _run_queries(
+        queries, database, S3_OUTPUT, max_age_minutes, unload=True, postprocess=_postprocess
+    )
+    errors = {name: result for name, result in results.items() if isinstance(result, Exception)}
+    if errors:
+        successes = {name: result for name, result in results.items() if name not in errors}
+        raise QueryBatchError(successes, errors)
+    return results
+
+def run_athena_query_cached(query, database):
+    """
+    Cached version of `run_athena_query`. Raises instead of returning an empty
+    DataFrame when the query fails.
+    """
+    try:
+        return run_queries_cached({'query': query}, database)['query']
+    except QueryBatchError as e:
+        raise e.errors['query']
+
+def _session_key(query, database):
+    """
+    Short key a query's result is stored under in st.session_state.df_cache.
+    """
+    return hashlib.blake2b(f"{database}\0{query}".encode(), digest_size=8).hexdigest()
+
+def load_dashboard_data(queries, database, postprocess=None, refresh=False):
+    """
+    Returns the DataFrames for `queries`. Results already fetched in this session are kept
+    in st.session_state.df_cache, so reruns of the script (tab switches, widget changes)
+    skip Athena and the post-processing, and only queries not fetched yet are run.
+    With `refresh=True` the session's results and the cached results shared across
+    sessions are dropped, and every query runs fresh.
+    Failed queries are reported, come back empty and are retried on the next rerun.
+    """
+    if refresh:
+        # Otherwise a second refresh within CACHE_TTL_SECONDS would get the first one's results
+        run_queries_cached.clear()
+    if 'df_cache' not in st.session_state or refresh:
+        st.session_state.df_cache = {}
+    df_cache = st.session_state.df_cache
+
+    keys = {name: _session_key(query, database) for name, query in queries.items()}
+    missing = {name: query for name, query in queries.items() if keys[name] not in df_cache}
+    if missing:
+        try:
+            fetched = run_queries_cached(
+                missing, database, max_age_minutes=None if refresh else 60, _postprocess=postprocess
+            )
+        except QueryBatchError as e:
+            for name, error in e.errors.items():
+                st.error(f"Query '{name}' failed: {error}")
+            fetched = e.results
+        for name, result in fetched.items():
+            df_cache[keys[name]] = result
+
+    return {
+        name: df_cache[keys[name]] if keys[name] in df_cache else _empty_result(name, postprocess)
+        for name in queries
+    }
+
+# --- 5. DASHBOARD QUERIES ---
+# The SQL lives in queries.py
+
+def split_revenue_rollup(df_rollup):
+    """
+    Splits the result of q_revenue_rollup into the DataFrames drawn by the
+    daily, payment method, region and top stores tiles.
+    """
+    if df_rollup.empty:
+        return {name: pd.DataFrame() for name in ['daily', 'payment', 'region', 'stores']}
+
+    def tile(name, key_column):
+        return df_rollup.loc[df_rollup['tile'] == name, [key_column, 'revenue']]
 
-# --- 4. DASHBOARD LAYOUT ---
+    # Transactions of unknown stores have no region
+    df_region = tile('region', 'region').dropna(subset=['region'])
+    return {
+        'daily': tile('daily', 'day').sort_values('day', ignore_index=True),
+        'payment': tile('payment', 'payment_method').sort_values('revenue', ascending=False, ignore_index=True),
+        'region': df_region.sort_values('revenue', ascending=False, ignore_index=True),
+        'stores': tile('stores', 'store_id').nlargest(15, 'revenue').reset_index(drop=True),
+    }
+
+# Every tile's query, run together before the layout is drawn
+QUERIES = {
+    "rollup": q_revenue_rollup,
+    "top_cust": q_top_cust,
+    "city": q_city,
+    "features": q_features,
+}
+
+# Pandas work run on a worker thread as soon as that query's results arrive
+POSTPROCESS = {
+    "rollup": split_revenue_rollup,
+}
+
+# --- 6. DASHBOARD LAYOUT ---
 st.set_page_config(page_title="Retail Analytics Dashboard", layout="wide")
 st.title("📊 Retail Performance Dashboard")
 st.markdown("Real-time insights from AWS Athena")
 
+refresh = st.button("🔄 Refresh data")
+
+with st.spinner("Running Athena queries..."):
+    data = load_dashboard_data(QUERIES, DATABASE, POSTPROCESS, refresh=refresh)
+data = {**data, **data["rollup"]}
+
 # Create tabs
 tab1, tab2, tab3 = st.tabs(["Overview & Trends", "Geography & Stores", "Customer Insights"])
 
@@ -78,24 +589,13 @@ with tab1:
     
     with col1:
         st.subheader("Daily Revenue Trend")
-        q_daily = """
-            SELECT date(CAST(timestamp AS TIMESTAMP)) AS day, SUM(net_amount) AS revenue
-            FROM ccdataset.transaction
-            GROUP BY 1 ORDER BY 1
-        """
-        df_daily = run_athena_query(q_daily, DATABASE, S3_OUTPUT)
+        df_daily = data["daily"]
         if not df_daily.empty:
-            df_daily['day'] = pd.to_datetime(df_daily['day'])
             st.line_chart(df_daily, x='day', y='revenue', color='#FF4B4B')
 
     with col2:
         st.subheader("Revenue by Payment Method")
-        q_payment = """
-            SELECT payment_method, SUM(net_amount) AS revenue
-            FROM ccdataset.transaction
-            GROUP BY payment_method ORDER BY revenue DESC
-        """
-        df_payment = run_athena_query(q_payment, DATABASE, S3_OUTPUT)
+        df_payment = data["payment"]
         if not df_payment.empty:
             st.bar_chart(df_payment, x='payment_method', y='revenue')
 
@@ -108,38 +608,20 @@ with tab2:
 
     with col1:
         st.subheader("Revenue by Region")
-        q_region = """
-            SELECT s.region, SUM(t.net_amount) AS revenue
-            FROM ccdataset.transaction t
-            JOIN ccdataset.stores s ON t.store_id = CAST(s.store_id AS VARCHAR)
-            GROUP BY s.region ORDER BY revenue DESC
-        """
-        df_region = run_athena_query(q_region, DATABASE, S3_OUTPUT)
+        df_region = data["region"]
         if not df_region.empty:
             st.bar_chart(df_region, x='region', y='revenue')
 
     with col2:
         st.subheader("Customer Distribution by City")
-        q_city = """
-            SELECT city, COUNT(*) AS customer_count
-            FROM ccdataset.customer
-            GROUP BY city ORDER BY customer_count DESC LIMIT 10
-        """
-        df_city = run_athena_query(q_city, DATABASE, S3_OUTPUT)
+        df_city = data["city"]
         if not df_city.empty:
             st.bar_chart(df_city, x='city', y='customer_count')
 
     # Top Performing Stores (Visualization only)
     st.subheader("Top Stores by Revenue")
-    q_stores = """
-        SELECT store_id, SUM(net_amount) AS revenue
-        FROM ccdataset.transaction
-        GROUP BY store_id ORDER BY revenue DESC LIMIT 15
-    """
-    df_stores = run_athena_query(q_stores, DATABASE, S3_OUTPUT)
+    df_stores = data["stores"]
     if not df_stores.empty:
-        # Convert store_id to string so it displays as categories, not numbers
-        df_stores['store_id'] = df_stores['store_id'].astype(str)
         st.bar_chart(df_stores, x='store_id', y='revenue')
 
 # ==========================================
@@ -147,29 +629,13 @@ with tab2:
 # ==========================================
 with tab3:
     st.subheader("Top High Value Customers (Last 30 Days)")
-    q_top_cust = """
-        SELECT customer_id, SUM(net_amount) AS revenue_30d
-        FROM ccdataset.transaction
-        WHERE CAST(timestamp AS DATE) >= current_date - interval '30' day
-        GROUP BY customer_id ORDER BY revenue_30d DESC LIMIT 10
-    """
-    df_top_cust = run_athena_query(q_top_cust, DATABASE, S3_OUTPUT)
+    df_top_cust = data["top_cust"]
     if not df_top_cust.empty:
         # Visualization instead of Table
-        df_top_cust['customer_id'] = df_top_cust['customer_id'].astype(str)
         st.bar_chart(df_top_cust, x='customer_id', y='revenue_30d')
 
     st.subheader("Customer Lifecycle Scatter: Spend vs Frequency")
-    q_features = """
-        SELECT c.customer_id,
-           COUNT(DISTINCT t.transaction_id) AS orders,
-           SUM(t.net_amount) AS total_spend
-        FROM ccdataset.customer c
-        LEFT JOIN ccdataset.transaction t ON c.customer_id = t.customer_id
-        GROUP BY c.customer_id
-        LIMIT 500
-    """
-    df_features = run_athena_query(q_features, DATABASE, S3_OUTPUT)
+    df_features = data["features"]
     
     if not df_features.empty:
         # Scatter chart only
@@ -179,4 +645,4 @@ with tab3:
             y='total_spend',
             size='total_spend', # Bubble size based on spend
             color='#33ff57'
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,119 @@
+"""
+SQL run by the dashboard (Streamlit_dashboard.py) and by the refresh job
+(refresh_aggregates.py).
+"""
+
+# --- DASHBOARD QUERIES ---
+# Daily, payment method, store and region revenue all come from one pass over tx_agg,
+# the hourly rollup of the transaction table kept up to date by refresh_aggregates.py.
+# Each grouping set ends up in its own `tile`.
+q_revenue_rollup = """
+    SELECT CASE GROUPING(day, payment_method, store_id, region)
+               WHEN 7 THEN 'daily'
+               WHEN 11 THEN 'payment'
+               WHEN 13 THEN 'stores'
+               ELSE 'region'
+           END AS tile,
+           day,
+           payment_method,
+           store_id,
+           region,
+           SUM(revenue) AS revenue
+    FROM ccdataset.tx_agg
+    GROUP BY GROUPING SETS ((day), (payment_method), (store_id), (region))
+"""
+
+# Customer ids aren't part of tx_agg, so this one reads the transactions. Filtering on
+# the dt partition column of transaction_p means only the last 30 days are scanned.
+q_top_cust = """
+    SELECT CAST(customer_id AS VARCHAR) AS customer_id, SUM(net_amount) AS revenue_30d
+    FROM ccdataset.transaction_p
+    WHERE dt >= current_date - interval '30' day
+    GROUP BY customer_id ORDER BY revenue_30d DESC LIMIT 10
+"""
+
+q_city = """
+    SELECT city, COUNT(*) AS customer_count
+    FROM ccdataset.customer
+    GROUP BY city ORDER BY customer_count DESC LIMIT 10
+"""
+
+# Transactions are aggregated per customer before the join, so the join only sees one
+# row per customer instead of every transaction. They're read from the Parquet copy in
+# transaction_p, so only the four columns used are scanned.
+q_features = """
+    WITH agg AS (
+        SELECT customer_id,
+               COUNT(DISTINCT transaction_id) AS orders,
+               SUM(net_amount) AS total_spend,
+               AVG(net_amount) AS avg_order,
+               MAX(timestamp) AS last_ts
+        FROM ccdataset.transaction_p
+        GROUP BY customer_id
+    )
+    SELECT c.customer_id,
+           COALESCE(a.orders, 0) AS orders,
+           a.total_spend,
+           a.avg_order,
+           date_diff('day', CAST(a.last_ts AS DATE), current_date) AS recency_days
+    FROM ccdataset.customer c
+    LEFT JOIN agg a ON c.customer_id = a.customer_id
+    LIMIT 500
+"""
+
+# --- REFRESH JOB STATEMENTS ---
+# Templates, filled in with str.format by refresh_aggregates.py
+
+# Empty copy of the transaction table, partitioned by day
+q_create_transaction_p = """
+    CREATE TABLE {database}.transaction_p
+    WITH (
+        format = 'PARQUET',
+        write_compression = 'SNAPPY',
+        external_location = '{location}',
+        partitioned_by = ARRAY['dt']
+    )
+    AS
+    SELECT *, CAST(timestamp AS DATE) AS dt
+    FROM {database}.transaction
+    WITH NO DATA
+"""
+
+q_fill_transaction_p = """
+    INSERT INTO {database}.transaction_p
+    SELECT *, CAST(timestamp AS DATE) AS dt
+    FROM {database}.transaction
+    WHERE CAST(timestamp AS DATE) BETWEEN DATE '{first}' AND DATE '{last}'
+"""
+
+# One day of transactions as Parquet files, for swapping in as that day's partition
+q_unload_day = """
+    UNLOAD (
+        SELECT * FROM {database}.transaction
+        WHERE CAST(timestamp AS DATE) = DATE '{day}'
+    )
+    TO '{location}'
+    WITH (format = 'PARQUET', compression = 'SNAPPY')
+"""
+
+# Revenue and transaction count per day, hour, payment method and store
+q_build_tx_agg = """
+    CREATE TABLE {database}.tx_agg_{suffix}
+    WITH (format = 'PARQUET', write_compression = 'SNAPPY', external_location = '{location}')
+    AS
+    SELECT date(CAST(t.timestamp AS TIMESTAMP)) AS day,
+           hour(CAST(t.timestamp AS TIMESTAMP)) AS hour,
+           t.payment_method,
+           CAST(t.store_id AS VARCHAR) AS store_id,
+           s.region,
+           SUM(t.net_amount) AS revenue,
+           COUNT(*) AS transactions
+    FROM {database}.transaction_p t
+    LEFT JOIN {database}.stores s ON t.store_id = CAST(s.store_id AS VARCHAR)
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+q_point_view = """
+    CREATE OR REPLACE VIEW {database}.tx_agg AS
+    SELECT * FROM {database}.tx_agg_{suffix}
+"""
@@ -0,0 +1,207 @@
+"""
+Rebuilds the pre-aggregated transaction table that the dashboard reads from.
+
+Meant to run on a schedule, e.g. hourly from cron or an EventBridge rule:
+
+    python refresh_aggregates.py
+
+Every run first brings `transaction_p` up to date: a Parquet copy of the transaction
+table partitioned by day (`dt`), so queries filtering on recent days only read those
+partitions. The latest day is rewritten and newer days are added; older days are
+assumed not to change. The latest day is written to a new prefix first and the partition
+is then pointed at it, so queries never see it empty or half-written. Its previous files
+are kept until the next run, for queries still reading them.
+
+It then writes a new Parquet table `tx_agg_<timestamp>` with a CTAS, points the
+`tx_agg` view at it and drops all but the two newest tables. The dashboard only
+ever queries the view, so it never sees a half-written table.
+
+A bytes-scanned limit for the dashboard's workgroup is set separately, with
+set_scan_limit.py.
+"""
+import argparse
+import boto3
+import time
+import os
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+from queries import (
+    q_create_transaction_p, q_fill_transaction_p, q_unload_day, q_build_tx_agg, q_point_view
+)
+
+# --- 1. LOAD ENVIRONMENT VARIABLES ---
+load_dotenv()
+
+# --- 2. CONFIGURATION ---
+# Keep these in line with Streamlit_dashboard.py
+AWS_REGION = 'ap-south-1'
+S3_OUTPUT = 's3://dku-project/Athena Output/'  # Must end with a slash /
+DATABASE = 'ccdataset'
+REFRESH_WORKGROUP = os.environ.get('ATHENA_REFRESH_WORKGROUP', 'primary')
+AGG_LOCATION = 's3://dku-project/aggregates/tx_agg/'  # Must end with a slash /
+KEEP_TABLES = 2  # The newest table plus the previous one, for queries still running on it
+KEEP_RELOADS = 2  # The same for the files of the reloaded latest day
+PARTITIONED_LOCATION = 's3://dku-project/partitioned/transaction_p/'  # Must end with a slash /
+RELOAD_LOCATION = 's3://dku-project/partitioned/transaction_p_reloads/'  # Must end with a slash /
+WINDOW_DAYS = 100  # Athena writes at most 100 partitions per statement
+
+athena = boto3.client('athena', region_name=AWS_REGION)
+s3 = boto3.client('s3', region_name=AWS_REGION)
+
+def run_statement(query):
+    """
+    Runs a statement on Athena and waits for it to finish.
+    Raises RuntimeError if it fails.
+    """
+    response = athena.start_query_execution(
+        QueryString=query,
+        QueryExecutionContext={'Database': DATABASE},
+        ResultConfiguration={'OutputLocation': S3_OUTPUT},
+        WorkGroup=REFRESH_WORKGROUP
+    )
+    query_execution_id = response['QueryExecutionId']
+
+    delay = 0.5
+    while True:
+        stats = athena.get_query_execution(QueryExecutionId=query_execution_id)
+        status = stats['QueryExecution']['Status']
+        if status['State'] in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 5.0)
+
+    if status['State'] != 'SUCCEEDED':
+        raise RuntimeError(f"Query failed: {status.get('StateChangeReason', status['State'])}")
+    return query_execution_id
+
+def fetch_value(query):
+    """
+    Runs a query returning a single value and returns it as a string (None for NULL).
+    """
+    query_execution_id = run_statement(query)
+    rows = athena.get_query_results(QueryExecutionId=query_execution_id)['ResultSet']['Rows']
+    # The first row holds the column names
+    return rows[1]['Data'][0].get('VarCharValue')
+
+def delete_prefix(s3_path):
+    """
+    Deletes every object under an s3://bucket/prefix/ path.
+    """
+    bucket, prefix = s3_path.removeprefix('s3://').split('/', 1)
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        objects = [{'Key': item['Key']} for item in page.get('Contents', [])]
+        if objects:
+            s3.delete_objects(Bucket=bucket, Delete={'Objects': objects})
+
+def list_folders(s3_path):
+    """
+    Returns the names of the folders directly under an s3://bucket/prefix/ path, newest
+    first for timestamped names.
+    """
+    bucket, prefix = s3_path.removeprefix('s3://').split('/', 1)
+    folders = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        folders += [item['Prefix'][len(prefix):].rstrip('/') for item in page.get('CommonPrefixes', [])]
+    return sorted(folders, reverse=True)
+
+def table_exists(name):
+    """
+    Whether the database already has a table called `name`.
+    """
+    try:
+        athena.get_table_metadata(CatalogName='AwsDataCatalog', DatabaseName=DATABASE, TableName=name)
+    except athena.exceptions.MetadataException:
+        return False
+    return True
+
+def reload_partition(day):
+    """
+    Rewrites one day of transaction_p. The day is unloaded to a new prefix and the partition
+    is pointed at it, so it is never empty or partial.
+    """
+    location = f"{RELOAD_LOCATION}{day}/{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}/"
+    print(f"Reloading {day} into {DATABASE}.transaction_p")
+    run_statement(q_unload_day.format(database=DATABASE, day=day, location=location))
+    run_statement(f"ALTER TABLE {DATABASE}.transaction_p PARTITION (dt = '{day}') SET LOCATION '{location}'")
+    delete_old_reloads(day)
+
+def delete_old_reloads(latest):
+    """
+    Deletes the files of the reloaded days that no partition points at anymore. The files
+    the latest day pointed at before this run's reload are kept until the next run, for
+    queries still reading them.
+    """
+    for day in list_folders(RELOAD_LOCATION):
+        # The newest reload of a day is its partition's location
+        keep = KEEP_RELOADS if day == latest else 1
+        reloads = list_folders(f"{RELOAD_LOCATION}{day}/")
+        for old in reloads[keep:]:
+            delete_prefix(f"{RELOAD_LOCATION}{day}/{old}/")
+        # Before its first reload, a day's files are wherever INSERT wrote them
+        if len(reloads) >= keep:
+            delete_prefix(f"{PARTITIONED_LOCATION}dt={day}/")
+
+def refresh_partitions():
+    """
+    Adds the days missing from transaction_p, rewriting the latest one it has since
+    more transactions may have arrived for it since the last run.
+    """
+    if not table_exists('transaction_p'):
+        print(f"Creating {DATABASE}.transaction_p")
+        run_statement(q_create_transaction_p.format(database=DATABASE, location=PARTITIONED_LOCATION))
+
+    latest = fetch_value(f"SELECT max(dt) FROM {DATABASE}.transaction_p")
+    if latest:
+        reload_partition(latest)
+        first = date.fromisoformat(latest) + timedelta(days=1)
+    else:
+        earliest = fetch_value(f"SELECT min(CAST(timestamp AS DATE)) FROM {DATABASE}.transaction")
+        if earliest is None:
+            return
+        first = date.fromisoformat(earliest)
+
+    today = datetime.now(timezone.utc).date()
+    while first <= today:
+        last = min(first + timedelta(days=WINDOW_DAYS - 1), today)
+        print(f"Loading transactions from {first} to {last} into {DATABASE}.transaction_p")
+        run_statement(q_fill_transaction_p.format(database=DATABASE, first=first, last=last))
+        first = last + timedelta(days=1)
+
+def table_suffixes():
+    """
+    Returns the suffixes of the existing tx_agg_<timestamp> tables, newest first.
+    """
+    suffixes = []
+    paginator = athena.get_paginator('list_table_metadata')
+    pages = paginator.paginate(CatalogName='AwsDataCatalog', DatabaseName=DATABASE, Expression='tx_agg_.*')
+    for page in pages:
+        suffixes += [
+            table['Name'].removeprefix('tx_agg_') for table in page['TableMetadataList']
+            if table['Name'].startswith('tx_agg_')
+        ]
+    return sorted(suffixes, reverse=True)
+
+def refresh():
+    """
+    Updates transaction_p, builds a new aggregate table from it, switches the tx_agg
+    view to the new table and drops old tables.
+    """
+    refresh_partitions()
+
+    suffix = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+    location = f"{AGG_LOCATION}{suffix}/"
+
+    print(f"Building {DATABASE}.tx_agg_{suffix}")
+    run_statement(q_build_tx_agg.format(database=DATABASE, suffix=suffix, location=location))
+    run_statement(q_point_view.format(database=DATABASE, suffix=suffix))
+
+    # CTAS tables are external, so dropping them leaves their files behind
+    for old in table_suffixes()[KEEP_TABLES:]:
+        print(f"Dropping {DATABASE}.tx_agg_{old}")
+        run_statement(f"DROP TABLE IF EXISTS {DATABASE}.tx_agg_{old}")
+        delete_prefix(f"{AGG_LOCATION}{old}/")
+
+if __name__ == '__main__':
+    # No options; parsing still rejects unknown arguments instead of ignoring them
+    argparse.ArgumentParser(description="Rebuild the tx_agg table the dashboard reads from.").parse_args()
+    refresh()
@@ -0,0 +1,48 @@
+"""
+Puts a bytes-scanned limit on the dashboard's Athena workgroup, so that a runaway
+dashboard query is cancelled by Athena instead of scanning the whole table.
+Run it once, e.g. for a 10 GB limit:
+
+    python set_scan_limit.py 10
+
+The hourly refresh (refresh_aggregates.py) scans all transactions, so it has to run in
+a workgroup without that limit: the limit is only set once ATHENA_REFRESH_WORKGROUP
+names a different workgroup than ATHENA_WORKGROUP.
+"""
+import argparse
+import boto3
+import os
+from dotenv import load_dotenv
+
+# --- 1. LOAD ENVIRONMENT VARIABLES ---
+load_dotenv()
+
+# --- 2. CONFIGURATION ---
+# Keep these in line with Streamlit_dashboard.py and refresh_aggregates.py
+AWS_REGION = 'ap-south-1'
+WORKGROUP = os.environ.get('ATHENA_WORKGROUP', 'primary')  # Used by the dashboard
+REFRESH_WORKGROUP = os.environ.get('ATHENA_REFRESH_WORKGROUP', 'primary')
+
+def set_scan_limit(limit_gb):
+    """
+    Makes Athena cancel any query in the dashboard's workgroup that scans more
+    than `limit_gb` gigabytes.
+    Refuses to when the refresh job runs in the same workgroup, since the limit
+    would cancel its full scans.
+    """
+    if WORKGROUP == REFRESH_WORKGROUP:
+        raise RuntimeError(
+            f"The dashboard and the refresh job both use workgroup {WORKGROUP}; "
+            "set ATHENA_REFRESH_WORKGROUP to a workgroup without a scan limit first"
+        )
+    athena = boto3.client('athena', region_name=AWS_REGION)
+    athena.update_work_group(
+        WorkGroup=WORKGROUP,
+        ConfigurationUpdates={'BytesScannedCutoffPerQuery': int(limit_gb * 1024 ** 3)}
+    )
+    print(f"Queries in workgroup {WORKGROUP} are now limited to {limit_gb} GB scanned")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Set the dashboard workgroup's per-query bytes-scanned limit.")
+    parser.add_argument('limit_gb', type=float, help="Gigabytes a single dashboard query may scan")
+    set_scan_limit(parser.parse_args().limit_gb)